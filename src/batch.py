@@ -0,0 +1,232 @@
+"""Answer a JSONL file of queries offline, with the same retrieval and
+completion pipeline the bot uses.
+
+    python -m src.batch queries.jsonl answers.jsonl --concurrency 8
+    python -m src.batch queries.jsonl batch_input.jsonl --batch-api
+
+Each input line is a JSON object with a "query" and optionally an "id" and a
+list of "vector_store_ids". Results are appended to the output as they finish, and ids
+already in the output are skipped, so an interrupted run resumes where it
+stopped. Failed queries are not written, so they are retried on the next run.
+With --batch-api, retrieval still runs here but the completions are written as
+requests for the provider's batch API instead of being sent.
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+from typing import Iterator, List, Optional, Set, Tuple
+
+from src.completion import (
+    COMPLETION_TEMPERATURE,
+    CompletionResult,
+    build_messages,
+    generate_completion_response,
+    newest_vector_store_ids,
+    search_vector_store,
+)
+from src.routing import route_query
+from src.utils import logger
+
+PROGRESS_LOG_EVERY = 100
+
+
+def read_done_ids(path: str) -> Set[str]:
+    done = set()
+    if not os.path.exists(path):
+        return done
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            try:
+                row = json.loads(line)
+            except ValueError:
+                # partial last line from an interrupted run
+                continue
+            done.add(str(row.get("id", row.get("custom_id"))))
+    return done
+
+
+def drop_partial_line(path: str):
+    # an interrupted run may leave a partial last row, cut it so the output
+    # stays valid JSONL and the query is retried
+    if not os.path.exists(path):
+        return
+    with open(path, "rb+") as f:
+        end = f.seek(0, os.SEEK_END)
+        position = end
+        while position > 0:
+            start = max(0, position - 65536)
+            f.seek(start)
+            chunk = f.read(position - start)
+            newline = chunk.rfind(b"\n")
+            if newline != -1:
+                position = start + newline + 1
+                break
+            position = start
+        if position != end:
+            f.truncate(position)
+
+
+def iter_queries(path: str, done: Set[str]) -> Iterator[Tuple[str, dict]]:
+    with open(path, "r", encoding="utf-8") as f:
+        for line_number, line in enumerate(f, start=1):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                row = json.loads(line)
+            except ValueError:
+                logger.warning(f"Line {line_number} is not valid JSON, skipped")
+                continue
+            if not isinstance(row, dict):
+                logger.warning(f"Line {line_number} is not a JSON object, skipped")
+                continue
+            if not row.get("query"):
+                logger.warning(f"Line {line_number} has no query, skipped")
+                continue
+            vector_store_ids = row.get("vector_store_ids")
+            if isinstance(vector_store_ids, str):
+                row["vector_store_ids"] = [vector_store_ids]
+            elif vector_store_ids is not None and not (
+                isinstance(vector_store_ids, list)
+                and all(isinstance(v, str) for v in vector_store_ids)
+            ):
+                logger.warning(
+                    f"Line {line_number} vector_store_ids is not a list of strings, skipped")
+                continue
+            query_id = str(row.get("id", line_number))
+            if query_id not in done:
+                yield query_id, row
+
+
+async def answer_query(
+    query_id: str, row: dict, vector_store_ids: List[str]
+) -> Optional[dict]:
+    response = await generate_completion_response(
+        openai_thread_id=query_id,
+        last_user_message=row["query"],
+        user="batch",
+        vector_store_ids=vector_store_ids,
+    )
+    if response.status is not CompletionResult.OK:
+        # not written, so the query is retried on the next run
+        logger.warning(f"Query {query_id} failed: {response.status.name} {response.status_text}")
+        return None
+    return {
+        "id": query_id,
+        "query": row["query"],
+        "status": response.status.name,
+        "reply": response.reply_text,
+    }
+
+
+async def build_batch_request(
+    query_id: str, row: dict, vector_store_ids: List[str]
+) -> Optional[dict]:
+    query = row["query"]
+    try:
+        results = await search_vector_store(query, vector_store_ids)
+    except Exception as e:
+        # not written, so the query is retried on the next run
+        logger.exception(e)
+        return None
+    decision = route_query(query, results)
+    return {
+        "custom_id": query_id,
+        "method": "POST",
+        "url": "/v1/chat/completions",
+        "body": {
+            "model": decision.model,
+            "temperature": COMPLETION_TEMPERATURE,
+            "messages": build_messages(query, results),
+        },
+    }
+
+
+async def run(args: argparse.Namespace):
+    done = read_done_ids(args.output)
+    drop_partial_line(args.output)
+    if done:
+        logger.info(f"Resuming, {len(done)} queries already in {args.output}")
+
+    default_store_ids = args.vector_store_ids or await newest_vector_store_ids()
+    if not default_store_ids:
+        raise SystemExit("Error: Could not find any vector store.")
+
+    handle = build_batch_request if args.batch_api else answer_query
+    # bounded so the input file is streamed instead of loaded into memory
+    queue: asyncio.Queue = asyncio.Queue(maxsize=args.concurrency * 2)
+    written = 0
+
+    with open(args.output, "a", encoding="utf-8") as out:
+
+        async def worker():
+            nonlocal written
+            while True:
+                item = await queue.get()
+                if item is None:
+                    return
+                query_id, row = item
+                try:
+                    record = await handle(
+                        query_id, row, row.get("vector_store_ids") or default_store_ids
+                    )
+                except Exception as e:
+                    logger.exception(e)
+                    record = None
+                if record is None:
+                    continue
+                out.write(json.dumps(record, ensure_ascii=False) + "\n")
+                out.flush()
+                written += 1
+                if written % PROGRESS_LOG_EVERY == 0:
+                    logger.info(f"{written} queries written to {args.output}")
+
+        workers = [asyncio.create_task(worker()) for _ in range(args.concurrency)]
+        for item in iter_queries(args.input, done):
+            await queue.put(item)
+        for _ in workers:
+            await queue.put(None)
+        await asyncio.gather(*workers)
+
+    logger.info(f"Done, {written} queries written to {args.output}")
+
+
+def positive_int(value: str) -> int:
+    number = int(value)
+    if number < 1:
+        raise argparse.ArgumentTypeError(f"must be at least 1, got {value}")
+    return number
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Answer a JSONL file of queries with the bot's pipeline."
+    )
+    parser.add_argument("input", help="JSONL file with one query per line")
+    parser.add_argument("output", help="JSONL file to append results to")
+    parser.add_argument(
+        "--concurrency", type=positive_int, default=8, help="queries processed at once"
+    )
+    parser.add_argument(
+        "--vector-store-ids",
+        type=lambda s: [v for v in s.split(",") if v],
+        default=None,
+        help="comma separated vector stores to search, defaults to the newest",
+    )
+    parser.add_argument(
+        "--batch-api",
+        action="store_true",
+        help="write chat completion requests for the provider's batch API",
+    )
+    args = parser.parse_args()
+
+    logging.basicConfig(
+        format="[%(asctime)s] [%(filename)s:%(lineno)d] %(message)s", level=logging.INFO
+    )
+    asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main()
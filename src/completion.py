@@ -1,3 +1,4 @@
+import asyncio
 from enum import Enum
 from dataclasses import dataclass
 import openai
@@ -12,13 +13,20 @@ from src.constants import (
 
 import discord
 from src.utils import split_into_shorter_messages, close_thread, logger
+from src.routing import route_query, create_routed_completion
 
-from src.constants import BOT_INSTRUCTIONS, DEFAULT_MODEL
+from src.constants import (
+    BOT_INSTRUCTIONS,
+    VECTOR_SEARCH_MAX_RESULTS,
+    VECTOR_SEARCH_DEADLINE_S,
+    RRF_K,
+)
 
 MY_BOT_NAME = BOT_NAME
 MY_BOT_EXAMPLE_CONVOS = EXAMPLE_CONVOS
 
 POLL_INTERVAL_S = 0.5
+COMPLETION_TEMPERATURE = 0.1
 
 
 class CompletionResult(Enum):
@@ -42,7 +50,6 @@ client = AsyncOpenAI(
     base_url='https://compass.llm.shopee.io/compass-api/v1',
 )
 
-default_model = DEFAULT_MODEL
 system_prompt = BOT_INSTRUCTIONS
 
 
@@ -55,6 +62,90 @@ def format_results(results):
         formatted_results += formatted_result + "</result>"
     return f"<sources>{formatted_results}</sources>"
 
+@dataclass
+class SearchResults:
+    data: List
+
+
+def fuse_results(result_lists: List, limit: int = VECTOR_SEARCH_MAX_RESULTS) -> SearchResults:
+    # reciprocal rank fusion, the same chunk found in several stores is kept once
+    scores = {}
+    chunks = {}
+    for results in result_lists:
+        for rank, result in enumerate(results.data):
+            key = (result.file_id, tuple(part.text for part in result.content))
+            scores[key] = scores.get(key, 0.0) + 1.0 / (RRF_K + rank + 1)
+            chunks.setdefault(key, result)
+    ranked = sorted(scores, key=scores.get, reverse=True)
+    return SearchResults(data=[chunks[key] for key in ranked[:limit]])
+
+
+async def search_one_vector_store(vector_store_id: str, query: str):
+    return await asyncio.wait_for(
+        client.vector_stores.search(
+            vector_store_id=vector_store_id,
+            query=query,
+            max_num_results = VECTOR_SEARCH_MAX_RESULTS,
+            rewrite_query= True
+        ),
+        timeout=VECTOR_SEARCH_DEADLINE_S,
+    )
+
+async def newest_vector_store_ids() -> List[str]:
+    vector_stores = await client.vector_stores.list(
+        limit=5,
+        order="desc"
+    )
+    return [vector_stores.data[0].id] if vector_stores.data else []
+
+# search the given vector stores, or the newest one when none are configured
+# returns None when there is no vector store
+
+
+async def search_vector_store(query: str, vector_store_ids: Optional[List[str]] = None):
+    if not vector_store_ids:
+        vector_store_ids = await newest_vector_store_ids()
+        if not vector_store_ids:
+            return None
+
+    searches = await asyncio.gather(
+        *[search_one_vector_store(i, query) for i in vector_store_ids],
+        return_exceptions=True,
+    )
+
+    result_lists = []
+    errors = []
+    for vector_store_id, search in zip(vector_store_ids, searches):
+        if isinstance(search, asyncio.TimeoutError):
+            logger.warning(
+                f"Vector store {vector_store_id} exceeded {VECTOR_SEARCH_DEADLINE_S}s, dropped")
+            errors.append(asyncio.TimeoutError(
+                f"Vector store search exceeded {VECTOR_SEARCH_DEADLINE_S}s"))
+        elif isinstance(search, Exception):
+            logger.warning(f"Vector store {vector_store_id} search failed: {search}")
+            errors.append(search)
+        else:
+            result_lists.append(search)
+
+    if not result_lists:
+        raise errors[0]
+
+    return fuse_results(result_lists)
+
+
+def build_messages(user_query: str, results) -> List[dict]:
+    formatted_results = format_results(results)
+    return [
+        {
+            "role": "system",
+            "content": system_prompt
+        },
+        {
+            "role": "user",
+            "content": f"Sources: {formatted_results}\n\nQuery: '{user_query}'"
+        }
+    ]
+
 # chat with the assistant
 
 
@@ -62,53 +153,39 @@ async def generate_completion_response(
     openai_thread_id: str,
     last_user_message: str,
     user: str,
+    search_task: Optional[asyncio.Task] = None,
+    vector_store_ids: Optional[List[str]] = None,
 ) -> CompletionData:
 
     try:
-        vector_stores = await client.vector_stores.list(
-            limit=5,
-            order="desc"
-        )
+        user_query = last_user_message
 
-        if not vector_stores.data:
+        # reuse the search started speculatively when the message arrived
+        if search_task is not None:
+            results = await search_task
+        else:
+            results = await search_vector_store(user_query, vector_store_ids)
+
+        if results is None:
             return CompletionData(
                 status=CompletionResult.OTHER_ERROR,
                 reply_text=None,
                 status_text="Error: Could not find any vector store.",
             )
 
-        vector_store_id = vector_stores.data[0].id
-        user_query = last_user_message
-
-        results = await client.vector_stores.search(
-            vector_store_id=vector_store_id,
-            query=user_query,
-            max_num_results = 5,
-            rewrite_query= True
-        )
-
-        formatted_results = format_results(results)
-
-        completion = await client.chat.completions.create(
-            model=default_model,
-            temperature=0.1,
-            messages=[
-                {
-                    "role": "system",
-                    "content": system_prompt
-                },
-                {
-                    "role": "user",
-                    "content": f"Sources: {formatted_results}\n\nQuery: '{user_query}'"
-                }
-            ],
+        decision = route_query(user_query, results)
+        completion, model = await create_routed_completion(
+            client,
+            decision,
+            temperature=COMPLETION_TEMPERATURE,
+            messages=build_messages(user_query, results),
         )
         # --- LOG TOKEN USAGE ---
         prompt_tokens = completion.usage.prompt_tokens
         completion_tokens = completion.usage.completion_tokens
         total_tokens = completion.usage.total_tokens
 
-        print(f"[TOKENS] prompt={prompt_tokens}, completion={completion_tokens}, total={total_tokens}")
+        logger.info(f"[TOKENS] model={model}, prompt={prompt_tokens}, completion={completion_tokens}, total={total_tokens}")
 
         reply = completion.choices[0].message.content
         reply = reply.strip()
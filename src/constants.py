@@ -23,6 +23,8 @@ EXAMPLE_CONVOS = CONFIG.example_conversations
 DISCORD_BOT_TOKEN = os.environ["DISCORD_BOT_TOKEN"]
 DISCORD_CLIENT_ID = os.environ["DISCORD_CLIENT_ID"]
 DEFAULT_MODEL = os.environ["DEFAULT_MODEL"]
+# faster model for simple queries, and fallback when DEFAULT_MODEL is too slow
+FAST_MODEL = os.environ.get("FAST_MODEL") or DEFAULT_MODEL
 
 ALLOWED_SERVER_IDS: List[int] = []
 server_ids = os.environ["ALLOWED_SERVER_IDS"].split(",")
@@ -35,6 +37,16 @@ for s in server_channels:
     values = s.split(":")
     SERVER_TO_MODERATION_CHANNEL[int(values[0])] = int(values[1])
 
+# vector stores to search per server or channel: id:vs_1|vs_2,id_2:vs_3
+# servers and channels not listed search the newest vector store
+VECTOR_STORES_BY_ID: Dict[int, List[str]] = {}
+vector_store_sets = os.environ.get("VECTOR_STORES_BY_ID", "").split(",")
+for s in vector_store_sets:
+    if not s:
+        continue
+    values = s.split(":")
+    VECTOR_STORES_BY_ID[int(values[0])] = [v for v in values[1].split("|") if v]
+
 # Send Messages, Create Public Threads, Send Messages in Threads, Manage Messages, Manage Threads, Read Message History, Use Slash Command
 BOT_INVITE_URL = f"https://discord.com/api/oauth2/authorize?client_id={DISCORD_CLIENT_ID}&permissions=328565073920&scope=bot"
 
@@ -76,5 +88,34 @@ MAX_CHARS_PER_REPLY_MSG = (
     1500  # discord has a 2k limit, we just break message into 1.5k
 )
 
+VECTOR_SEARCH_MAX_RESULTS = 5
+# seconds to wait for each vector store, slower stores are left out of the sources
+VECTOR_SEARCH_DEADLINE_S = float(os.environ.get("VECTOR_SEARCH_DEADLINE_S", 10))
+RRF_K = 60  # reciprocal rank fusion constant, lowers the weight of top ranks
+
+# model routing: queries up to this many chars go to FAST_MODEL
+ROUTER_SHORT_QUERY_CHARS = int(os.environ.get("ROUTER_SHORT_QUERY_CHARS", 80))
+# queries longer than this (or containing code) always go to DEFAULT_MODEL
+ROUTER_LONG_QUERY_CHARS = int(os.environ.get("ROUTER_LONG_QUERY_CHARS", 400))
+# top vector store search score at which retrieval is trusted enough for FAST_MODEL
+ROUTER_RETRIEVAL_SCORE = float(os.environ.get("ROUTER_RETRIEVAL_SCORE", 0.8))
+# keywords of frequently asked questions that FAST_MODEL can handle
+ROUTER_FAQ_KEYWORDS: List[str] = [
+    k.strip().lower()
+    for k in os.environ.get("ROUTER_FAQ_KEYWORDS", "").split(",")
+    if k.strip()
+]
+# seconds to wait for DEFAULT_MODEL before falling back to FAST_MODEL, 0 to disable
+PRIMARY_MODEL_DEADLINE_S = float(os.environ.get("PRIMARY_MODEL_DEADLINE_S", 20))
+
+# event loop monitoring: warn when the loop is blocked longer than this,
+# keep it above LOOP_HEARTBEAT_INTERVAL_S
+LOOP_BLOCK_THRESHOLD_S = float(os.environ.get("LOOP_BLOCK_THRESHOLD_S", 0.25))
+LOOP_HEARTBEAT_INTERVAL_S = 0.1
+# asyncio debug mode names every slow callback, but slows the bot down
+LOOP_DEBUG = os.environ.get("LOOP_DEBUG", "").lower() in ("1", "true")
+PROFILE_MAX_SECONDS = 60
+PROFILE_SAMPLE_INTERVAL_S = 0.005
+
 AVAILABLE_MODELS = Literal["gpt-3.5-turbo",
                            "gpt-4", "gpt-4-1106-preview", "gpt-4-32k"]
@@ -1,5 +1,5 @@
 from collections import defaultdict
-from typing import Literal, Optional, Union
+from typing import List, Literal, Optional, Union
 
 import discord
 from discord import Message as DiscordMessage, app_commands
@@ -11,6 +11,7 @@ from src.constants import (
     ACTIVATE_THREAD_PREFX,
     MAX_THREAD_MESSAGES,
     SECONDS_DELAY_RECEIVING_MSG,
+    PROFILE_MAX_SECONDS,
 )
 import asyncio
 from src.utils import (
@@ -20,12 +21,15 @@ from src.utils import (
     is_last_message_stale,
     discord_message_to_message,
     split_into_shorter_messages,
+    get_vector_store_ids,
 )
 from src import completion
+from src.monitor import loop_monitor, sample_stacks
 from src.completion import generate_completion_response, process_response
+import io
 import os
+import threading
 from flask import Flask
-from threading import Thread
 
 logging.basicConfig(
     format="[%(asctime)s] [%(filename)s:%(lineno)d] %(message)s", level=logging.INFO
@@ -39,6 +43,35 @@ tree = discord.app_commands.CommandTree(client)
 
 openai_thread_mapping = {}
 user_mention_threads = {}
+# vector store searches started while waiting for more messages, by discord thread id
+speculative_searches = {}
+
+
+def retrieve_search_exception(task: asyncio.Task):
+    # superseded searches are never awaited, read their error so asyncio does not warn
+    if not task.cancelled():
+        task.exception()
+
+
+def start_speculative_search(
+    thread_id: int, query: str, vector_store_ids: Optional[List[str]]
+) -> asyncio.Task:
+    # a newer message replaces the query, so the older search is wasted work
+    previous = speculative_searches.pop(thread_id, None)
+    if previous and not previous.done():
+        previous.cancel()
+    task = asyncio.create_task(completion.search_vector_store(query, vector_store_ids))
+    task.add_done_callback(retrieve_search_exception)
+    speculative_searches[thread_id] = task
+    return task
+
+
+def claim_speculative_search(thread_id: int, task: asyncio.Task) -> bool:
+    # once claimed, newer messages can no longer cancel the search
+    if speculative_searches.get(thread_id) is task:
+        del speculative_searches[thread_id]
+        return True
+    return False
 
 
 @client.event
@@ -48,8 +81,45 @@ async def on_ready():
 
     completion.MY_BOT_NAME = client.user.name
 
+    loop_monitor.start()
+
     await tree.sync()
 
+
+# sample the event loop to find what blocks it, admins only
+@tree.command(name="profile", description="Profile the bot's event loop")
+@app_commands.default_permissions(administrator=True)
+@app_commands.describe(seconds="How long to sample the event loop for")
+async def profile_command(
+    interaction: discord.Interaction,
+    seconds: app_commands.Range[int, 1, PROFILE_MAX_SECONDS] = 10,
+):
+    try:
+        if should_block(guild=interaction.guild):
+            await interaction.response.send_message(
+                "This server is not allowed to use this command.", ephemeral=True
+            )
+            return
+
+        await interaction.response.defer(ephemeral=True, thinking=True)
+        # this handler runs on the loop thread, which is the one to sample
+        folded = await asyncio.to_thread(
+            sample_stacks, threading.get_ident(), seconds
+        )
+        await interaction.followup.send(
+            f"Max loop lag {loop_monitor.max_lag_s:.3f}s, blocked {loop_monitor.blocked_count} times. "
+            "Open the file with speedscope or flamegraph.pl.",
+            file=discord.File(io.BytesIO(folded.encode("utf-8")), filename="profile.folded"),
+            ephemeral=True,
+        )
+    except Exception as e:
+        logger.exception(e)
+        error_text = f"Sorry, profiling failed: {str(e)}"
+        if interaction.response.is_done():
+            await interaction.followup.send(error_text, ephemeral=True)
+        else:
+            await interaction.response.send_message(error_text, ephemeral=True)
+
 # handle when bot is mentioned
 
 
@@ -89,6 +159,7 @@ async def handle_mention_message(message: DiscordMessage):
                 openai_thread_id=openai_thread_id,
                 last_user_message=content,
                 user=message.author,
+                vector_store_ids=get_vector_store_ids(message.channel),
             )
 
             # Send response
@@ -192,6 +263,17 @@ async def on_message(message: DiscordMessage):
             await close_thread(thread=thread)
             return
 
+        # get the openai thread id for the thread
+        openai_thread_id = openai_thread_mapping.get(thread.id)
+
+        # start searching right away so the results are ready after the delay,
+        # unless the thread cannot be answered anyway
+        search_task = None
+        if openai_thread_id:
+            search_task = start_speculative_search(
+                thread.id, message.content, get_vector_store_ids(thread)
+            )
+
         # wait a bit in case user has more messages
         if SECONDS_DELAY_RECEIVING_MSG > 0:
             await asyncio.sleep(SECONDS_DELAY_RECEIVING_MSG)
@@ -201,15 +283,18 @@ async def on_message(message: DiscordMessage):
                 bot_id=client.user.id,
             ):
                 # there is another message, so ignore this one
+                if search_task and claim_speculative_search(thread.id, search_task):
+                    search_task.cancel()
                 return
 
+        if search_task and not claim_speculative_search(thread.id, search_task):
+            # a newer message cancelled our search and will be answered instead
+            return
+
         logger.info(
             f"Thread message to process - {message.author}: {message.content[:50]} - {thread.name} {thread.jump_url}"
         )
 
-        # get the openai thread id for the thread
-        openai_thread_id = openai_thread_mapping.get(thread.id)
-
         if not openai_thread_id:
             # handle the case where the thread is not found
             logger.warning(
@@ -223,6 +308,7 @@ async def on_message(message: DiscordMessage):
                 openai_thread_id=openai_thread_id,
                 last_user_message=message.content,
                 user=message.author,
+                search_task=search_task,
             )
 
         if is_last_message_stale(
@@ -256,7 +342,7 @@ def run_flask():
 
 
 # run flask
-flask_thread = Thread(target=run_flask)
+flask_thread = threading.Thread(target=run_flask)
 flask_thread.start()
 
 client.run(DISCORD_BOT_TOKEN)
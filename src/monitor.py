@@ -0,0 +1,101 @@
+import asyncio
+import os
+import sys
+import threading
+import time
+import traceback
+from collections import Counter
+
+from src.constants import (
+    LOOP_BLOCK_THRESHOLD_S,
+    LOOP_HEARTBEAT_INTERVAL_S,
+    LOOP_DEBUG,
+    PROFILE_SAMPLE_INTERVAL_S,
+)
+from src.utils import logger
+
+
+class LoopMonitor:
+    """Measures event loop lag with a heartbeat task, and logs the loop
+    thread's stack from a watchdog thread while the loop is blocked."""
+
+    def __init__(self):
+        self.loop_thread_id = None
+        self.last_beat = time.monotonic()
+        self.max_lag_s = 0.0
+        self.blocked_count = 0
+        self._task = None
+
+    def start(self):
+        if self._task is not None:
+            return
+        loop = asyncio.get_running_loop()
+        loop.slow_callback_duration = LOOP_BLOCK_THRESHOLD_S
+        if LOOP_DEBUG:
+            loop.set_debug(True)
+        self.loop_thread_id = threading.get_ident()
+        self.last_beat = time.monotonic()
+        self._task = loop.create_task(self._heartbeat())
+        threading.Thread(target=self._watchdog, daemon=True).start()
+
+    async def _heartbeat(self):
+        while True:
+            expected = time.monotonic() + LOOP_HEARTBEAT_INTERVAL_S
+            await asyncio.sleep(LOOP_HEARTBEAT_INTERVAL_S)
+            self.last_beat = time.monotonic()
+            lag = self.last_beat - expected
+            self.max_lag_s = max(self.max_lag_s, lag)
+            if lag > LOOP_BLOCK_THRESHOLD_S:
+                logger.warning(f"[LOOP] lag {lag:.3f}s")
+
+    def _watchdog(self):
+        reported = False
+        while True:
+            time.sleep(LOOP_HEARTBEAT_INTERVAL_S)
+            blocked_for = time.monotonic() - self.last_beat
+            # last_beat is at most one heartbeat old while the loop runs, and the
+            # threshold is larger than that, so this only trips on a real block
+            if blocked_for <= LOOP_BLOCK_THRESHOLD_S:
+                reported = False
+                continue
+            if reported:
+                # one stack per block is enough
+                continue
+            reported = True
+            self.blocked_count += 1
+            frame = sys._current_frames().get(self.loop_thread_id)
+            stack = "".join(traceback.format_stack(frame)) if frame else ""
+            logger.warning(
+                f"[LOOP] blocked for {blocked_for:.2f}s, loop thread stack:\n{stack}"
+            )
+
+
+def fold_stack(frame) -> str:
+    names = []
+    while frame is not None:
+        code = frame.f_code
+        names.append(
+            f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+        )
+        frame = frame.f_back
+    return ";".join(reversed(names))
+
+
+def sample_stacks(
+    thread_id: int, seconds: float, interval_s: float = PROFILE_SAMPLE_INTERVAL_S
+) -> str:
+    """Sample the stack of a thread for some seconds, and return the samples
+    in the folded format read by flamegraph.pl and speedscope. Blocks the
+    calling thread, so run it off the event loop."""
+    counts = Counter()
+    deadline = time.monotonic() + seconds
+    while time.monotonic() < deadline:
+        frame = sys._current_frames().get(thread_id)
+        if frame is not None:
+            counts[fold_stack(frame)] += 1
+        del frame
+        time.sleep(interval_s)
+    return "\n".join(f"{stack} {count}" for stack, count in counts.most_common())
+
+
+loop_monitor = LoopMonitor()
@@ -0,0 +1,140 @@
+import asyncio
+import time
+from collections import defaultdict
+from dataclasses import dataclass
+from typing import Dict, Optional, Tuple
+
+from src.constants import (
+    DEFAULT_MODEL,
+    FAST_MODEL,
+    ROUTER_SHORT_QUERY_CHARS,
+    ROUTER_LONG_QUERY_CHARS,
+    ROUTER_RETRIEVAL_SCORE,
+    ROUTER_FAQ_KEYWORDS,
+    PRIMARY_MODEL_DEADLINE_S,
+)
+from src.utils import logger
+
+ROUTER_SUMMARY_EVERY = 100  # routed completions between two summary log lines
+
+
+@dataclass(frozen=True)
+class RouteDecision:
+    model: str
+    fallback_model: Optional[str]
+    reason: str
+
+
+@dataclass
+class ModelLatency:
+    calls: int = 0
+    timeouts: int = 0
+    errors: int = 0
+    total_s: float = 0.0
+    max_s: float = 0.0
+
+    def record(self, elapsed_s: float, timed_out: bool = False, failed: bool = False):
+        self.calls += 1
+        self.total_s += elapsed_s
+        self.max_s = max(self.max_s, elapsed_s)
+        if timed_out:
+            self.timeouts += 1
+        if failed:
+            self.errors += 1
+
+    @property
+    def mean_s(self) -> float:
+        return self.total_s / self.calls if self.calls else 0.0
+
+
+# routing decisions by reason, and latency by model, since the bot started
+route_counts: Dict[str, int] = defaultdict(int)
+model_latencies: Dict[str, ModelLatency] = defaultdict(ModelLatency)
+
+
+def routing_summary() -> str:
+    reasons = " ".join(f"{reason}={count}" for reason, count in sorted(route_counts.items()))
+    models = " ".join(
+        f"{model}={latency.calls}/{latency.mean_s:.2f}s/{latency.timeouts}/{latency.errors}"
+        for model, latency in sorted(model_latencies.items())
+    )
+    return f"routes: {reasons} | models (calls/mean/timeouts/errors): {models}"
+
+
+def top_score(results) -> float:
+    if results is None or not results.data:
+        return 0.0
+    return max(result.score or 0.0 for result in results.data)
+
+
+def route_query(query: str, results=None) -> RouteDecision:
+    if FAST_MODEL == DEFAULT_MODEL:
+        return RouteDecision(model=DEFAULT_MODEL, fallback_model=None, reason="single_model")
+
+    escalate = RouteDecision(
+        model=DEFAULT_MODEL, fallback_model=FAST_MODEL, reason="complex_query"
+    )
+    text = query.strip()
+    if "```" in text or len(text) > ROUTER_LONG_QUERY_CHARS:
+        return escalate
+
+    if top_score(results) >= ROUTER_RETRIEVAL_SCORE:
+        return RouteDecision(model=FAST_MODEL, fallback_model=None, reason="confident_retrieval")
+
+    if len(text) <= ROUTER_SHORT_QUERY_CHARS:
+        return RouteDecision(model=FAST_MODEL, fallback_model=None, reason="short_query")
+
+    lowered = text.lower()
+    if any(keyword in lowered for keyword in ROUTER_FAQ_KEYWORDS):
+        return RouteDecision(model=FAST_MODEL, fallback_model=None, reason="faq")
+
+    return RouteDecision(model=DEFAULT_MODEL, fallback_model=FAST_MODEL, reason="default")
+
+
+async def _timed_create(client, model: str, timeout: Optional[float], **kwargs):
+    start = time.perf_counter()
+    try:
+        completion = await asyncio.wait_for(
+            client.chat.completions.create(model=model, **kwargs), timeout=timeout
+        )
+    except asyncio.TimeoutError:
+        model_latencies[model].record(time.perf_counter() - start, timed_out=True)
+        raise
+    except Exception:
+        model_latencies[model].record(time.perf_counter() - start, failed=True)
+        raise
+    model_latencies[model].record(time.perf_counter() - start)
+    return completion
+
+
+async def create_routed_completion(
+    client, decision: RouteDecision, **kwargs
+) -> Tuple[object, str]:
+    """Create a chat completion with the routed model, falling back to the
+    faster model when the primary one misses PRIMARY_MODEL_DEADLINE_S.
+
+    Returns the completion and the model that produced it.
+    """
+    route_counts[decision.reason] += 1
+    timeout = None
+    if decision.fallback_model and PRIMARY_MODEL_DEADLINE_S > 0:
+        timeout = PRIMARY_MODEL_DEADLINE_S
+
+    try:
+        completion = await _timed_create(client, decision.model, timeout, **kwargs)
+        model = decision.model
+    except asyncio.TimeoutError:
+        logger.warning(
+            f"[ROUTER] {decision.model} exceeded {timeout}s, falling back to {decision.fallback_model}"
+        )
+        completion = await _timed_create(client, decision.fallback_model, None, **kwargs)
+        model = decision.fallback_model
+
+    latency = model_latencies[model]
+    logger.info(
+        f"[ROUTER] reason={decision.reason} model={model} "
+        f"mean={latency.mean_s:.2f}s max={latency.max_s:.2f}s calls={latency.calls}"
+    )
+    if sum(route_counts.values()) % ROUTER_SUMMARY_EVERY == 0:
+        logger.info(f"[ROUTER] {routing_summary()}")
+    return completion, model
@@ -9,7 +9,11 @@ from discord import Message as DiscordMessage
 from typing import Optional, List
 import discord
 
-from src.constants import MAX_CHARS_PER_REPLY_MSG, INACTIVATE_THREAD_PREFIX
+from src.constants import (
+    MAX_CHARS_PER_REPLY_MSG,
+    INACTIVATE_THREAD_PREFIX,
+    VECTOR_STORES_BY_ID,
+)
 
 
 def discord_message_to_message(message: DiscordMessage) -> Optional[Message]:
@@ -68,3 +72,15 @@ def should_block(guild: Optional[discord.Guild]) -> bool:
         logger.info(f"Guild {guild} not allowed")
         return True
     return False
+
+
+def get_vector_store_ids(channel: discord.abc.Messageable) -> Optional[List[str]]:
+    # most specific first: thread, parent channel, then server
+    ids = [getattr(channel, "id", None), getattr(channel, "parent_id", None)]
+    guild = getattr(channel, "guild", None)
+    if guild:
+        ids.append(guild.id)
+    for i in ids:
+        if i in VECTOR_STORES_BY_ID:
+            return VECTOR_STORES_BY_ID[i]
+    return None